@@ -15,7 +15,9 @@
 
 import json
 import os
+import copy
 import datetime
+import tempfile
 from dateutil import parser
 
 from adapt.intent import IntentBuilder
@@ -195,6 +197,199 @@ class HabitsManager(object):
         """Return one particular habit trigger"""
         return self.triggers[trigger_id]
 
+    def apply_batch(self, operations):
+        """
+        Apply several habit modifications as one transaction
+
+        The operations are applied on copies of the habits and triggers.
+        If all of them succeed, habits.json and triggers.json are written
+        together with write_files, and only if they changed. If one of
+        them fails, nothing is saved and every operation is reported as not
+        applied.
+
+        Args:
+            operations (datastore): the operations to apply, each one with
+                an "op" ("set_automatized", "set_triggers" or
+                "cancel_event") and a "habit_id"
+
+        Returns:
+            (bool, datastore, int[]): whether the batch was committed, the
+                result of each operation and the ids of the habits whose
+                scheduled event has to be cancelled
+
+        Raises:
+            IOError, OSError: if the files cannot be saved, in which case
+                neither the files nor the loaded habits are modified
+        """
+        habits = copy.deepcopy(self.habits)
+        triggers = copy.deepcopy(self.triggers)
+        results = []
+        to_cancel = []
+        habits_modified = False
+        triggers_modified = False
+
+        for operation in operations:
+            if not isinstance(operation, dict):
+                results += [{"op": None, "habit_id": None, "success": False,
+                             "error": "invalid operation"}]
+                continue
+            op = operation.get("op")
+            habit_id = operation.get("habit_id")
+            result = {"op": op, "habit_id": habit_id, "success": True}
+            results += [result]
+
+            if not is_int(habit_id) or not 0 <= habit_id < len(habits):
+                result["success"] = False
+                result["error"] = "unknown habit"
+                continue
+            habit = habits[habit_id]
+
+            if op == "set_automatized":
+                auto = operation.get("automatized")
+                if not is_int(auto) or auto not in (0, 1, 2):
+                    result["success"] = False
+                    result["error"] = "automatized must be 0, 1 or 2"
+                    continue
+                habit["user_choice"] = True
+                habit["automatized"] = auto
+                habits_modified = True
+            elif op == "set_triggers":
+                error = self.reassign_triggers(
+                    habit_id, habit, triggers, operation.get("triggers"))
+                if error:
+                    result["success"] = False
+                    result["error"] = error
+                    continue
+                habits_modified = True
+                triggers_modified = True
+            elif op == "cancel_event":
+                if habit["trigger_type"] != "time":
+                    result["success"] = False
+                    result["error"] = "habit is not time based"
+                    continue
+                if habit_id not in to_cancel:
+                    to_cancel += [habit_id]
+            else:
+                result["success"] = False
+                result["error"] = "unknown operation"
+
+        if not all(result["success"] for result in results):
+            for result in results:
+                if result["success"]:
+                    result["success"] = False
+                    result["error"] = "batch aborted"
+            return False, results, []
+
+        self.write_files(habits if habits_modified else None,
+                         triggers if triggers_modified else None)
+        if habits_modified:
+            self.habits = habits
+        if triggers_modified:
+            self.triggers = triggers
+
+        return True, results, to_cancel
+
+    def write_files(self, habits=None, triggers=None):
+        """
+        Replace habits.json and triggers.json as one operation
+
+        Both files are first written to temporary files in their directory,
+        then renamed over the original ones, so that a failed write leaves
+        both files untouched.
+
+        Args:
+            habits (datastore): the habits to save, None to keep the file
+            triggers (datastore): the triggers to save, None to keep the file
+        """
+        to_write = []
+        if habits is not None:
+            to_write += [(self.habits_file_path, habits)]
+        if triggers is not None:
+            to_write += [(self.triggers_file_path, triggers)]
+
+        written = []
+        try:
+            for path, data in to_write:
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=os.path.dirname(path), suffix=".tmp")
+                written += [(tmp_path, path)]
+                with os.fdopen(fd, 'w') as tmp_file:
+                    json.dump(data, tmp_file)
+        except (IOError, OSError):
+            for tmp_path, _ in written:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            raise
+
+        for tmp_path, path in written:
+            os.rename(tmp_path, path)
+
+    def reassign_triggers(self, habit_id, habit, triggers, new_triggers):
+        """
+        Replace the triggers of a skill habit in a list of triggers
+
+        skill-listener refers to triggers by their position in
+        triggers.json, so the triggers of the other habits never move: the
+        new triggers reuse the slots of the old ones, extra ones are
+        appended and unused slots are kept as disabled triggers (with a
+        null "habit_id") unless they are at the end of the list.
+
+        Args:
+            habit_id (int): the id of the habit to modify
+            habit (datastore): the habit to modify
+            triggers (datastore): the triggers list to update in place
+            new_triggers (int[]): the intents to register as triggers
+
+        Returns:
+            str: an error message, None if the triggers were reassigned
+        """
+        if habit["trigger_type"] != "skill":
+            return "habit is not skill based"
+        if not new_triggers or not isinstance(new_triggers, list) or \
+                not all(is_int(i) and 0 <= i < len(habit["intents"])
+                        for i in new_triggers):
+            return "invalid triggers"
+        if len(set(new_triggers)) != len(new_triggers):
+            return "duplicate triggers"
+
+        for known_trig in triggers:
+            if known_trig["habit_id"] == habit_id:
+                continue
+            for i in new_triggers:
+                if habit["intents"][i]["name"] == known_trig["intent"] and \
+                    habit["intents"][i]["parameters"] \
+                        == known_trig["parameters"]:
+                    return "command already a trigger of another habit"
+
+        slots = [index for index, trig in enumerate(triggers)
+                 if trig["habit_id"] == habit_id]
+        for i in new_triggers:
+            trigger = {
+                "intent": habit["intents"][i]["name"],
+                "parameters": habit["intents"][i]["parameters"],
+                "habit_id": habit_id
+            }
+            if slots:
+                triggers[slots.pop(0)] = trigger
+            else:
+                triggers += [trigger]
+        for index in slots:
+            triggers[index] = {
+                "intent": None,
+                "parameters": None,
+                "habit_id": None
+            }
+        while triggers and triggers[-1]["habit_id"] is None:
+            triggers.pop()
+        habit["triggers"] = new_triggers
+
+        return None
+
+
+def is_int(value):
+    """Return True if value is an integer (booleans excluded)"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
 
 class AutomationHandlerSkill(MycroftSkill):
     """
@@ -230,6 +425,9 @@ class AutomationHandlerSkill(MycroftSkill):
             "TriggerDetectedKeyword").require("Number").build()
         self.register_intent(trigger_detected, self.handle_trigger_detected)
 
+        self.add_event("automation_handler:batch_modify",
+                       self.handle_batch_modify)
+
 # region Mycroft first dialog
 
     def handle_habit_detected(self, message):
@@ -451,6 +649,9 @@ class AutomationHandlerSkill(MycroftSkill):
         LOGGER.info("Loading trigger number " + message.data.get("Number"))
         self.trigger = self.manager.get_trigger_by_id(int(
             message.data.get("Number")))
+        if self.trigger["habit_id"] is None:
+            LOGGER.info("Trigger disabled")
+            return
         self.habit = self.manager.get_habit_by_id(self.trigger["habit_id"])
         LOGGER.info("Habit number " + str(self.trigger["habit_id"]))
 
@@ -631,6 +832,43 @@ class AutomationHandlerSkill(MycroftSkill):
             self.list_index, commands, optional, stat)
         self.speak(dial, expect_response=True)
 
+    def handle_batch_modify(self, message):
+        """
+        Apply a batch of habit modifications received on the message bus
+
+        The result is emitted as "automation_handler:batch_modify.response"
+        with the per-operation results. A malformed batch, unreadable
+        habits files or a failed save are answered with "committed" set to
+        False and an "error". Cancelling an event that is not scheduled
+        does nothing.
+        """
+        response = {"committed": False, "results": []}
+        operations = message.data.get("operations")
+        if not isinstance(operations, list):
+            response["error"] = "operations must be a list"
+        else:
+            try:
+                self.manager.load_files()
+            except (IOError, ValueError) as e:
+                response["error"] = "cannot load habits: " + str(e)
+            else:
+                try:
+                    committed, results, to_cancel = \
+                        self.manager.apply_batch(operations)
+                except (IOError, OSError) as e:
+                    response["error"] = "cannot save habits: " + str(e)
+                else:
+                    for habit_id in to_cancel:
+                        self.cancel_scheduled_event(
+                            "habit_automation_nb_{}".format(habit_id))
+                    response["committed"] = committed
+                    response["results"] = results
+        LOGGER.info("Batch modification committed: " +
+                    str(response["committed"]))
+
+        self.emitter.emit(
+            Message("automation_handler:batch_modify.response", response))
+
 # endregion
 
 # region Dependent skills installation
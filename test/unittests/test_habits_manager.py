@@ -0,0 +1,281 @@
+import imp
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                    os.pardir, os.pardir)
+skill_module = imp.load_source("automation_handler",
+                               os.path.join(ROOT, "__init__.py"))
+replay_trace = imp.load_source(
+    "replay_trace", os.path.join(ROOT, "tools", "replay_trace.py"))
+
+from mycroft.messagebus.message import Message  # noqa: E402
+
+
+def intent(name):
+    return {"name": name, "parameters": {}, "last_utterance": name}
+
+
+HABITS = [
+    {
+        "intents": [intent("a"), intent("b")],
+        "trigger_type": "skill",
+        "automatized": 1,
+        "user_choice": True,
+        "triggers": [0]
+    },
+    {
+        "intents": [intent("c"), intent("d")],
+        "trigger_type": "skill",
+        "automatized": 2,
+        "user_choice": True,
+        "triggers": [0, 1]
+    },
+    {
+        "intents": [intent("e")],
+        "trigger_type": "time",
+        "automatized": 1,
+        "user_choice": True,
+        "time": "10:00",
+        "days": [0, 1]
+    },
+    {
+        "intents": [intent("f"), intent("b")],
+        "trigger_type": "skill",
+        "automatized": 0,
+        "user_choice": False,
+        "triggers": []
+    }
+]
+
+TRIGGERS = [
+    {"intent": "a", "parameters": {}, "habit_id": 0},
+    {"intent": "c", "parameters": {}, "habit_id": 1},
+    {"intent": "d", "parameters": {}, "habit_id": 1}
+]
+
+
+class TestApplyBatch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.manager = skill_module.HabitsManager()
+        self.manager.habits_file_path = os.path.join(self.dir, "habits.json")
+        self.manager.triggers_file_path = os.path.join(self.dir,
+                                                       "triggers.json")
+        with open(self.manager.habits_file_path, 'w') as habits_file:
+            json.dump(HABITS, habits_file)
+        with open(self.manager.triggers_file_path, 'w') as triggers_file:
+            json.dump(TRIGGERS, triggers_file)
+        self.manager.load_files()
+        # Any file found after a batch has been written by it
+        os.remove(self.manager.habits_file_path)
+        os.remove(self.manager.triggers_file_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def apply(self, operations):
+        return self.manager.apply_batch(operations)
+
+    def written(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path) as json_file:
+            return json.load(json_file)
+
+    def test_commit(self):
+        committed, results, to_cancel = self.apply([
+            {"op": "set_automatized", "habit_id": 3, "automatized": 1},
+            {"op": "set_triggers", "habit_id": 3, "triggers": [1]},
+            {"op": "cancel_event", "habit_id": 2}
+        ])
+        self.assertTrue(committed)
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertEqual(to_cancel, [2])
+        habits = self.written(self.manager.habits_file_path)
+        self.assertEqual(habits[3]["automatized"], 1)
+        self.assertTrue(habits[3]["user_choice"])
+        self.assertEqual(habits[3]["triggers"], [1])
+        self.assertEqual(self.written(self.manager.triggers_file_path)[-1],
+                         {"intent": "b", "parameters": {}, "habit_id": 3})
+
+    def test_rollback(self):
+        committed, results, to_cancel = self.apply([
+            {"op": "set_automatized", "habit_id": 0, "automatized": 0},
+            {"op": "set_triggers", "habit_id": 2, "triggers": [0]}
+        ])
+        self.assertFalse(committed)
+        self.assertEqual(to_cancel, [])
+        self.assertEqual(results[0]["error"], "batch aborted")
+        self.assertEqual(results[1]["error"], "habit is not skill based")
+        self.assertFalse(any(result["success"] for result in results))
+        self.assertEqual(self.manager.habits, HABITS)
+        self.assertEqual(self.manager.triggers, TRIGGERS)
+
+    def test_no_write_when_batch_fails(self):
+        self.apply([
+            {"op": "set_automatized", "habit_id": 0, "automatized": 0},
+            {"op": "set_triggers", "habit_id": 3, "triggers": [0]},
+            {"op": "unknown", "habit_id": 0}
+        ])
+        self.assertIsNone(self.written(self.manager.habits_file_path))
+        self.assertIsNone(self.written(self.manager.triggers_file_path))
+
+    def test_no_habits_write_without_habit_change(self):
+        committed, _, to_cancel = self.apply([])
+        self.assertTrue(committed)
+        committed, _, to_cancel = self.apply(
+            [{"op": "cancel_event", "habit_id": 2}])
+        self.assertTrue(committed)
+        self.assertEqual(to_cancel, [2])
+        self.assertIsNone(self.written(self.manager.habits_file_path))
+        self.assertIsNone(self.written(self.manager.triggers_file_path))
+
+    def test_trigger_conflict_in_batch(self):
+        committed, results, _ = self.apply([
+            {"op": "set_triggers", "habit_id": 0, "triggers": [1]},
+            {"op": "set_triggers", "habit_id": 3, "triggers": [0]},
+            {"op": "set_triggers", "habit_id": 3, "triggers": [1]}
+        ])
+        self.assertFalse(committed)
+        self.assertEqual(results[2]["error"],
+                         "command already a trigger of another habit")
+
+    def test_trigger_index_stability(self):
+        committed, _, _ = self.apply([
+            {"op": "set_triggers", "habit_id": 0, "triggers": [1]},
+            {"op": "set_triggers", "habit_id": 1, "triggers": [1]}
+        ])
+        self.assertTrue(committed)
+        triggers = self.written(self.manager.triggers_file_path)
+        self.assertEqual(triggers, [
+            {"intent": "b", "parameters": {}, "habit_id": 0},
+            {"intent": "d", "parameters": {}, "habit_id": 1}
+        ])
+
+        self.manager.triggers = TRIGGERS + [
+            {"intent": "f", "parameters": {}, "habit_id": 3}]
+        committed, _, _ = self.apply(
+            [{"op": "set_triggers", "habit_id": 1, "triggers": [0]}])
+        self.assertTrue(committed)
+        triggers = self.written(self.manager.triggers_file_path)
+        self.assertEqual(triggers[0], TRIGGERS[0])
+        self.assertEqual(triggers[2]["habit_id"], None)
+        self.assertEqual(triggers[3]["habit_id"], 3)
+
+    def test_invalid_operations(self):
+        for operation, error in [
+                ("x", "invalid operation"),
+                ({"op": "set_automatized", "habit_id": True,
+                  "automatized": 1}, "unknown habit"),
+                ({"op": "set_automatized", "habit_id": 0,
+                  "automatized": True}, "automatized must be 0, 1 or 2"),
+                ({"op": "set_automatized", "habit_id": 0,
+                  "automatized": 1.0}, "automatized must be 0, 1 or 2"),
+                ({"op": "set_triggers", "habit_id": 3,
+                  "triggers": [1, 1]}, "duplicate triggers"),
+                ({"op": "set_triggers", "habit_id": 3,
+                  "triggers": [False]}, "invalid triggers")]:
+            committed, results, _ = self.apply([operation])
+            self.assertFalse(committed)
+            self.assertEqual(results[0]["error"], error)
+
+    def test_save_failure(self):
+        self.manager.habits_file_path = os.path.join(self.dir, "missing",
+                                                     "habits.json")
+        with self.assertRaises((IOError, OSError)):
+            self.apply([
+                {"op": "set_automatized", "habit_id": 0, "automatized": 0},
+                {"op": "set_triggers", "habit_id": 3, "triggers": [0]}
+            ])
+        self.assertEqual(self.manager.habits, HABITS)
+        self.assertEqual(self.manager.triggers, TRIGGERS)
+        self.assertEqual(os.listdir(self.dir), [])
+
+
+class TestAutomationHandlerSkill(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.bus = replay_trace.FakeBus()
+        self.skill = skill_module.create_skill()
+        self.skill.bind(self.bus)
+        self.skill.check_skills_intallation = lambda: True
+        self.cancelled = []
+        self.skill.cancel_scheduled_event = self.cancelled.append
+        manager = self.skill.manager
+        manager.habits_file_path = os.path.join(self.dir, "habits.json")
+        manager.triggers_file_path = os.path.join(self.dir, "triggers.json")
+        with open(manager.habits_file_path, 'w') as habits_file:
+            json.dump(HABITS, habits_file)
+        with open(manager.triggers_file_path, 'w') as triggers_file:
+            json.dump(TRIGGERS, triggers_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def emitted(self, message_type):
+        return [message for message in self.bus.emitted
+                if message.type == message_type]
+
+    def batch(self, data):
+        self.skill.handle_batch_modify(
+            Message("automation_handler:batch_modify", data))
+        responses = self.emitted("automation_handler:batch_modify.response")
+        self.assertEqual(len(responses), 1)
+        return responses[0].data
+
+    def test_batch_response(self):
+        response = self.batch({"operations": [
+            {"op": "set_automatized", "habit_id": 0, "automatized": 2},
+            {"op": "cancel_event", "habit_id": 2},
+            {"op": "cancel_event", "habit_id": 2}
+        ]})
+        self.assertTrue(response["committed"])
+        self.assertEqual(len(response["results"]), 3)
+        self.assertEqual(self.cancelled, ["habit_automation_nb_2"])
+
+    def test_batch_not_a_list(self):
+        response = self.batch({"operations": "x"})
+        self.assertFalse(response["committed"])
+        self.assertEqual(response["error"], "operations must be a list")
+
+    def test_batch_unreadable_files(self):
+        with open(self.skill.manager.habits_file_path, 'w') as habits_file:
+            habits_file.write("{")
+        response = self.batch({"operations": []})
+        self.assertFalse(response["committed"])
+        self.assertTrue(response["error"].startswith("cannot load habits"))
+
+    def test_batch_save_failure(self):
+        manager = self.skill.manager
+        manager.load_files()
+        manager.load_files = lambda: None
+        manager.triggers_file_path = os.path.join(self.dir, "missing",
+                                                  "triggers.json")
+        response = self.batch({"operations": [
+            {"op": "set_triggers", "habit_id": 3, "triggers": [0]},
+            {"op": "cancel_event", "habit_id": 2}
+        ]})
+        self.assertFalse(response["committed"])
+        self.assertTrue(response["error"].startswith("cannot save habits"))
+        self.assertEqual(self.cancelled, [])
+        with open(manager.habits_file_path) as habits_file:
+            self.assertEqual(json.load(habits_file), HABITS)
+
+    def test_disabled_trigger(self):
+        with open(self.skill.manager.triggers_file_path, 'w') as trig_file:
+            json.dump([{"intent": None, "parameters": None,
+                        "habit_id": None}] + TRIGGERS, trig_file)
+        self.skill.handle_trigger_detected(
+            Message("TriggerDetectedIntent", {"Number": "0"}))
+        self.assertIsNone(self.skill.habit)
+        self.assertEqual(self.emitted("recognizer_loop:utterance"), [])
+
+        self.skill.handle_trigger_detected(
+            Message("TriggerDetectedIntent", {"Number": "1"}))
+        utterances = self.emitted("recognizer_loop:utterance")
+        self.assertEqual([message.data["utterances"] for message in
+                          utterances], [["b"]])
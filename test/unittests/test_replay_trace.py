@@ -0,0 +1,102 @@
+import argparse
+import imp
+import os
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                    os.pardir, os.pardir)
+FIXTURES = os.path.join(ROOT, "test", "replay")
+replay_trace = imp.load_source(
+    "replay_trace", os.path.join(ROOT, "tools", "replay_trace.py"))
+
+
+class TestReplayTrace(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.bus = replay_trace.FakeBus()
+        self.skill = replay_trace.create_skill(
+            self.bus, os.path.join(FIXTURES, "habits.json"),
+            os.path.join(FIXTURES, "triggers.json"), self.dir)
+        self.events = replay_trace.load_trace(
+            os.path.join(FIXTURES, "trace.jsonl"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_trace(self, lines):
+        path = os.path.join(self.dir, "trace.jsonl")
+        with open(path, 'w') as trace_file:
+            trace_file.write("\n".join(lines))
+        return path
+
+    def utterances(self, report):
+        return [(output["time"], output["text"])
+                for output in report["outputs"]
+                if output["type"] == "utterance"]
+
+    def test_max_speed(self):
+        report = replay_trace.replay(self.events, self.skill, self.bus, 0)
+        self.assertEqual(report["events"], 6)
+        self.assertNotIn("queueing_delay", report)
+        self.assertEqual(report["unanswered_offers"], [])
+        self.assertEqual(report["errors"], [])
+        # The scheduled habit does not run on sundays
+        self.assertEqual(self.utterances(report), [
+            (0.5, "what's the weather"),
+            (1.5, "turn on the lights"),
+            (2.0, "read the news")])
+
+    def test_unanswered_offer(self):
+        events = replay_trace.load_trace(self.write_trace([
+            '{"time": 0.0, "event": "TriggerDetected", "number": 1}',
+            '{"time": 0.5, "event": "TriggerDetected", "number": 0}'
+        ]))
+        report = replay_trace.replay(events, self.skill, self.bus, 0)
+        self.assertEqual(report["unanswered_offers"], [0.0])
+        self.assertEqual(self.utterances(report),
+                         [(0.5, "what's the weather")])
+
+    def test_declined_offer(self):
+        events = replay_trace.load_trace(self.write_trace([
+            '{"time": 0.0, "event": "TriggerDetected", "number": 1}',
+            '{"time": 0.2, "event": "OfferAnswer", "accept": false}',
+            '{"time": 0.5, "event": "TriggerDetected", "number": 0}'
+        ]))
+        report = replay_trace.replay(events, self.skill, self.bus, 0)
+        self.assertEqual(report["unanswered_offers"], [])
+        self.assertEqual(self.utterances(report),
+                         [(0.5, "what's the weather")])
+
+    def test_handler_error(self):
+        events = replay_trace.load_trace(self.write_trace([
+            '{"time": 0.0, "event": "TriggerDetected", "number": 9}',
+            '{"time": 0.5, "event": "TriggerDetected", "number": 0}'
+        ]))
+        report = replay_trace.replay(events, self.skill, self.bus, 0)
+        self.assertEqual(len(report["errors"]), 1)
+        self.assertEqual(report["errors"][0]["time"], 0.0)
+        self.assertTrue(
+            report["errors"][0]["error"].startswith("IndexError"))
+        self.assertEqual(self.utterances(report),
+                         [(0.5, "what's the weather")])
+
+    def test_invalid_trace(self):
+        path = self.write_trace([
+            '{"time": 0.0, "event": "HabitDetected", "number": 3}',
+            '{"time": 1.0, "event": "ScheduledHabit", "habit_id": 2}'
+        ])
+        with self.assertRaises(ValueError) as context:
+            replay_trace.load_trace(path)
+        self.assertIn("line 2: missing or invalid weekday",
+                      str(context.exception))
+
+    def test_negative_speed(self):
+        with self.assertRaises(argparse.ArgumentTypeError):
+            replay_trace.speed_factor("-1")
+
+    def test_paced(self):
+        report = replay_trace.replay(self.events, self.skill, self.bus, 100)
+        self.assertIn("queueing_delay", report)
+        self.assertGreaterEqual(report["duration"], 2.5 / 100)
@@ -0,0 +1,372 @@
+# Copyright 2018 Adrien CHEVRIER, Florian HEPP, Xavier HERMAND,
+#                Gauthier LEONARD, Audrey LY, Elliot MAINCOURT
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Replay a recorded trace of skill-listener events against the automation
+handler skill, on a local fake message bus.
+
+The trace is a file with one JSON event per line:
+
+    {"time": 0.0, "event": "HabitDetected", "number": 3}
+    {"time": 1.5, "event": "TriggerDetected", "number": 0}
+    {"time": 1.5, "event": "TriggerDetected", "number": 1}
+    {"time": 4.0, "event": "OfferAnswer", "accept": true}
+    {"time": 60.0, "event": "ScheduledHabit", "habit_id": 2, "weekday": 0}
+
+"time" is the offset in seconds from the start of the recording,
+"weekday" (0 for monday) is the recorded day of a scheduled event and
+"accept" is the user's answer to the last habit offer. An offer left
+unanswered when the next event arrives is dropped and reported.
+
+Usage:
+    python tools/replay_trace.py trace.jsonl habits.json triggers.json
+        [--speed 1] [--output report.json]
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import imp
+import json
+import os
+import shutil
+import tempfile
+import time
+import types
+
+from mycroft.messagebus.message import Message
+
+SKILL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, "__init__.py")
+
+
+class ReplayDatetime(datetime.datetime):
+    """
+    This class replaces datetime.datetime in the skill module so that the
+    day of a scheduled event is the recorded one
+
+    Attributes:
+        weekday_override (int): the day returned by today (0 for monday)
+    """
+
+    weekday_override = 0
+
+    @classmethod
+    def today(cls):
+        # January 1st 2018 is a monday
+        return cls(2018, 1, 1 + cls.weekday_override)
+
+
+class FakeBus(object):
+    """
+    This class replaces the websocket message bus of Mycroft
+
+    The handlers are called synchronously and every emitted message is
+    recorded.
+
+    Attributes:
+        handlers (datastore): the handlers registered for each message type
+        emitted (Message[]): all the messages emitted on the bus
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.emitted = []
+
+    def on(self, event, handler):
+        self.handlers.setdefault(event, []).append(handler)
+
+    def once(self, event, handler):
+        def wrapper(message):
+            self.remove(event, wrapper)
+            handler(message)
+        self.on(event, wrapper)
+
+    def remove(self, event, handler):
+        if handler in self.handlers.get(event, []):
+            self.handlers[event].remove(handler)
+
+    def remove_all_listeners(self, event):
+        self.handlers.pop(event, None)
+
+    def emit(self, message):
+        self.emitted += [message]
+        for handler in list(self.handlers.get(message.type, [])):
+            handler(message)
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def check_event(event):
+    """Return an error message if a trace event is invalid, else None"""
+    if not isinstance(event, dict):
+        return "event must be a JSON object"
+    if not isinstance(event.get("time"), (int, float)) or \
+            isinstance(event.get("time"), bool):
+        return "missing or invalid time"
+    if event.get("event") in ("HabitDetected", "TriggerDetected"):
+        if not is_int(event.get("number")):
+            return "missing or invalid number"
+    elif event.get("event") == "ScheduledHabit":
+        if not is_int(event.get("habit_id")):
+            return "missing or invalid habit_id"
+        if not is_int(event.get("weekday")) or \
+                not 0 <= event["weekday"] <= 6:
+            return "missing or invalid weekday (0 to 6)"
+    elif event.get("event") == "OfferAnswer":
+        if not isinstance(event.get("accept"), bool):
+            return "missing or invalid accept"
+    else:
+        return "unknown event {}".format(event.get("event"))
+    return None
+
+
+def load_trace(trace_path):
+    """
+    Return the events of a trace file, sorted by time
+
+    Raises:
+        ValueError: if a line is not a valid event
+    """
+    events = []
+    with open(trace_path) as trace_file:
+        for line_number, line in enumerate(trace_file, 1):
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                error = "invalid JSON"
+            else:
+                error = check_event(event)
+            if error:
+                raise ValueError("{}, line {}: {}".format(
+                    trace_path, line_number, error))
+            events += [event]
+    return sorted(events, key=lambda event: event["time"])
+
+
+def create_skill(bus, habits_path, triggers_path, work_dir):
+    """
+    Load the automation handler skill and bind it to the fake bus
+
+    The habits and triggers snapshot is copied to work_dir so that the
+    replay does not modify it.
+    """
+    skill_module = imp.load_source("automation_handler", SKILL_PATH)
+    skill_module.datetime = types.ModuleType("datetime")
+    skill_module.datetime.datetime = ReplayDatetime
+    skill = skill_module.create_skill()
+
+    skill.manager.habits_file_path = os.path.join(work_dir, "habits.json")
+    skill.manager.triggers_file_path = os.path.join(work_dir,
+                                                    "triggers.json")
+    shutil.copy(habits_path, skill.manager.habits_file_path)
+    shutil.copy(triggers_path, skill.manager.triggers_file_path)
+
+    # skill-listener only runs when the dependent skills are installed
+    skill.check_skills_intallation = lambda: True
+
+    skill.bind(bus)
+    skill.initialize()
+    return skill
+
+
+def dispatch(skill, event):
+    """Call the skill handler corresponding to a trace event"""
+    if event["event"] == "HabitDetected":
+        skill.handle_habit_detected(
+            Message("HabitDetectedIntent", {"Number": str(event["number"])}))
+    elif event["event"] == "TriggerDetected":
+        skill.handle_trigger_detected(
+            Message("TriggerDetectedIntent",
+                    {"Number": str(event["number"])}))
+    elif event["event"] == "ScheduledHabit":
+        ReplayDatetime.weekday_override = event["weekday"]
+        event_name = "habit_automation_nb_{}".format(event["habit_id"])
+        skill.handle_scheduled_habit(
+            Message(event_name, {"habit_id": event["habit_id"],
+                                 "event_name": event_name}))
+    elif event["accept"]:
+        skill.handle_complete_automation()
+    else:
+        skill.handle_not_complete_automation()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def replay(events, skill, bus, speed):
+    """
+    Replay the events against the skill
+
+    Args:
+        events (datastore): the trace events, sorted by time
+        skill (AutomationHandlerSkill): the skill to drive
+        bus (FakeBus): the bus the skill is bound to
+        speed (float): replay speed factor, 0 to replay at max speed
+
+    Returns:
+        datastore: the replay report
+    """
+    delays = []
+    service_times = []
+    outputs = []
+    errors = []
+    unanswered_offers = []
+    pending_offer = None
+    origin = events[0]["time"] if events else 0.0
+
+    start = time.time()
+    for event in events:
+        arrival = start
+        if speed:
+            arrival += (event["time"] - origin) / speed
+            now = time.time()
+            if arrival > now:
+                time.sleep(arrival - now)
+
+        if pending_offer is not None and event["event"] != "OfferAnswer":
+            # Without an answer, the offered intents would leak into the
+            # next automation
+            skill.to_execute = []
+            unanswered_offers += [pending_offer]
+        pending_offer = None
+
+        first_message = len(bus.emitted)
+        begin = time.time()
+        try:
+            dispatch(skill, event)
+        except Exception as e:
+            # Like Mycroft, keep going after a handler failure
+            errors += [{"time": event["time"], "event": event["event"],
+                        "error": "{}: {}".format(type(e).__name__, e)}]
+        end = time.time()
+        if skill.to_execute:
+            pending_offer = event["time"]
+        if speed:
+            delays += [begin - arrival]
+        service_times += [end - begin]
+
+        for message in bus.emitted[first_message:]:
+            if message.type == "recognizer_loop:utterance":
+                outputs += [{"time": event["time"], "type": "utterance",
+                             "text": message.data["utterances"][0]}]
+            elif message.type == "speak":
+                outputs += [{"time": event["time"], "type": "speak",
+                             "text": message.data["utterance"]}]
+    duration = time.time() - start
+    busy = sum(service_times)
+    if pending_offer is not None:
+        skill.to_execute = []
+        unanswered_offers += [pending_offer]
+
+    report = {
+        "events": len(events),
+        "speed": speed,
+        "duration": duration,
+        # Paced by the trace unless replayed at max speed
+        "throughput": len(events) / duration if duration else 0.0,
+        "capacity": len(events) / busy if busy else 0.0,
+        "service_time": {
+            "mean": busy / len(service_times) if service_times else 0.0,
+            "p95": percentile(service_times, 95)
+        },
+        "outputs": outputs,
+        "unanswered_offers": unanswered_offers,
+        "errors": errors
+    }
+    if speed:
+        report["queueing_delay"] = {
+            "mean": sum(delays) / len(delays) if delays else 0.0,
+            "p50": percentile(delays, 50),
+            "p95": percentile(delays, 95),
+            "max": max(delays) if delays else 0.0
+        }
+    return report
+
+
+def speed_factor(value):
+    speed = float(value)
+    if speed < 0:
+        raise argparse.ArgumentTypeError("speed must be 0 or positive")
+    return speed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Replay a skill-listener trace against the automation "
+                    "handler skill.")
+    arg_parser.add_argument("trace", help="recorded events, one per line")
+    arg_parser.add_argument("habits", help="habits.json snapshot")
+    arg_parser.add_argument("triggers", help="triggers.json snapshot")
+    arg_parser.add_argument("--speed", type=speed_factor, default=1.0,
+                            help="replay speed factor, 0 for max speed")
+    arg_parser.add_argument("--output",
+                            help="write the full report to this JSON file")
+    args = arg_parser.parse_args()
+
+    try:
+        events = load_trace(args.trace)
+    except ValueError as e:
+        arg_parser.error(str(e))
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        bus = FakeBus()
+        skill = create_skill(bus, args.habits, args.triggers, work_dir)
+        report = replay(events, skill, bus, args.speed)
+    finally:
+        shutil.rmtree(work_dir)
+
+    print("Events replayed: {}".format(report["events"]))
+    print("Duration: {:.3f} s".format(report["duration"]))
+    if args.speed:
+        print("Throughput: {:.1f} events/s (arrival rate of the trace at "
+              "speed {:g})".format(report["throughput"], args.speed))
+        print("Queueing delay: mean {mean:.4f} s, p50 {p50:.4f} s, "
+              "p95 {p95:.4f} s, max {max:.4f} s".format(
+                  **report["queueing_delay"]))
+    else:
+        print("Throughput: {:.1f} events/s (sustained, max speed)".format(
+            report["throughput"]))
+        print("Queueing delay: n/a at max speed")
+    print("Capacity: {:.1f} events/s (1 / mean service time)".format(
+        report["capacity"]))
+    print("Service time: mean {mean:.4f} s, p95 {p95:.4f} s".format(
+        **report["service_time"]))
+    print("Unanswered offers: {}".format(len(report["unanswered_offers"])))
+    print("Errors: {}".format(len(report["errors"])))
+    for error in report["errors"]:
+        print("  [{time}] {event}: {error}".format(**error))
+    print("Utterances:")
+    for output in report["outputs"]:
+        if output["type"] == "utterance":
+            print("  [{}] {}".format(output["time"], output["text"]))
+
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            json.dump(report, report_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()